@@ -1,20 +1,67 @@
-from confluent_kafka import DeserializingConsumer, TopicPartition
+from confluent_kafka import Consumer as ConfluentConsumer, TopicPartition
+from confluent_kafka.error import ConsumeError, KeyDeserializationError, ValueDeserializationError
 from confluent_kafka.schema_registry.avro import AvroDeserializer
-from .custom_exceptions import NoMessageError, ConsumeMessageError, FinishedTransactionBatch
+from confluent_kafka.serialization import SerializationContext, MessageField
+from .custom_exceptions import NoMessageError, FinishedTransactionBatch
 from .general_utils import parse_headers, get_guid_from_message
-from copy import deepcopy
+from collections import defaultdict, deque
+from functools import lru_cache
 import logging
-import datetime
+import time
 
 LOGGER = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=128)
+def _get_key_deserializer(schema_registry):
+    """Shared per schema registry client since keys are always plain strings"""
+    return AvroDeserializer(schema_registry, schema_str='{"type": "string"}')
+
+
+@lru_cache(maxsize=128)
+def _get_value_deserializer(schema_registry):
+    """Shared per schema registry client; the deserializer caches writer schemas as it encounters them"""
+    return AvroDeserializer(schema_registry)
+
+
+@lru_cache(maxsize=128)
+def _build_config(urls, group_id, on_commit, schema_registry, settings_items, auth_items):
+    """
+    Builds the client config once per unique set of inputs; settings/auth are passed as sorted item tuples so they hash.
+    NOTE: the result is shared, so callers must copy it before modifying.
+    """
+    settings = {
+        "bootstrap.servers": urls,
+
+        "group.id": group_id,
+        "on_commit": on_commit,
+        "enable.auto.offset.store": False,  # ensures auto-committing doesn't happen before the consumed message is actually finished
+        "partition.assignment.strategy": 'cooperative-sticky',
+
+        # Registry Serialization Settings
+        "key.deserializer": _get_key_deserializer(schema_registry),
+        "value.deserializer": _get_value_deserializer(schema_registry) if schema_registry else None,
+    }
+    settings.update(settings_items)
+    settings.update(auth_items)
+    return settings
+
+
 class Consumer:
+    # confluent consumer methods exposed directly on this class; subscribe/seek/pause/unassign are wrapped below instead
+    _delegated_methods = (
+        'assign', 'assignment', 'close', 'committed', 'consumer_group_metadata', 'get_watermark_offsets',
+        'incremental_assign', 'list_topics', 'offsets_for_times', 'position', 'resume', 'store_offsets',
+        'unsubscribe',
+    )
+
     def __init__(self, urls, group_id, consume_topics_list, schema_registry=None, auto_subscribe=True, client_auth_config=None, settings_config=None, metrics_manager=None):
         self._urls = ','.join(urls) if isinstance(urls, list) else urls
         self._auth = client_auth_config
         self._settings = settings_config
         self._consumer = None
+        self._key_deserializer = None
+        self._value_deserializer = None
         self._group_id = group_id
         self._topic_metadata = None
         self._schema_registry = schema_registry
@@ -23,16 +70,13 @@ class Consumer:
         self.metrics_manager = metrics_manager
         self.topics = consume_topics_list if isinstance(consume_topics_list, list) else consume_topics_list.split(',')
         self._poll_timeout = self._settings.poll_timeout_secs if self._settings else 5
+        self._consume_batch_size = (self._settings.batch_consume_max_count if self._settings else None) or 500
+        self._message_buffer = deque()
+        self._batch_fetch = True
+        self._is_changelog_cache = {}
 
         self._init_consumer(auto_subscribe=auto_subscribe)
 
-    def __getattr__(self, attr):
-        """Note: this includes methods as well!"""
-        try:
-            return self.__getattribute__(attr)
-        except AttributeError:
-            return self._consumer.__getattribute__(attr)
-
     @staticmethod
     def _consume_message_callback(error, partitions):
         """
@@ -45,72 +89,126 @@ class Consumer:
             LOGGER.debug('Consumer Callback - Message consumption committed successfully')
 
     def _make_config(self):
-        settings = {
-            "bootstrap.servers": self._urls,
-
-            "group.id": self._group_id,
-            "on_commit": self._consume_message_callback,
-            "enable.auto.offset.store": False,  # ensures auto-committing doesn't happen before the consumed message is actually finished
-            "partition.assignment.strategy": 'cooperative-sticky',
-
-            # Registry Serialization Settings
-            "key.deserializer": AvroDeserializer(self._schema_registry, schema_str='{"type": "string"}'),
-            "value.deserializer": AvroDeserializer(self._schema_registry) if self._schema_registry else None,
-        }
-
-        if self._settings:
-            settings.update(self._settings.as_client_dict())
-        if self._auth:
-            settings.update(self._auth.as_client_dict())
-        return settings
+        settings_items = tuple(sorted(self._settings.as_client_dict().items())) if self._settings else ()
+        auth_items = tuple(sorted(self._auth.as_client_dict().items())) if self._auth else ()
+        return dict(_build_config(
+            self._urls, self._group_id, self._consume_message_callback, self._schema_registry, settings_items, auth_items))
 
     def _init_consumer(self, auto_subscribe=True):
         LOGGER.debug('Initializing Consumer...')
-        self._consumer = DeserializingConsumer(self._make_config())
+        config = self._make_config()
+        # deserialization is handled here rather than by a DeserializingConsumer, which does not support batch consuming
+        self._key_deserializer = config.pop("key.deserializer")
+        self._value_deserializer = config.pop("value.deserializer")
+        self._consumer = ConfluentConsumer(config)
+        for method in self._delegated_methods:
+            setattr(self, method, getattr(self._consumer, method))
         LOGGER.info('Consumer Initialized!')
         if auto_subscribe:
-            self._consumer.subscribe(topics=self.topics)
+            self.subscribe(self.topics)
             LOGGER.info(f'Consumer subscribed to topics {self.topics}!')
 
+    def _deserialize_message(self, message):
+        """Mirrors the handling of DeserializingConsumer.poll() for a raw message"""
+        if message.error() is not None:
+            raise ConsumeError(message.error(), kafka_message=message)
+        ctx = SerializationContext(message.topic(), MessageField.VALUE, message.headers())
+        value = message.value()
+        if self._value_deserializer is not None:
+            try:
+                value = self._value_deserializer(value, ctx)
+            except Exception as e:
+                raise ValueDeserializationError(exception=e, kafka_message=message)
+        key = message.key()
+        ctx.field = MessageField.KEY
+        if self._key_deserializer is not None:
+            try:
+                key = self._key_deserializer(key, ctx)
+            except Exception as e:
+                raise KeyDeserializationError(exception=e, kafka_message=message)
+        message.set_key(key)
+        message.set_value(value)
+        return message
+
     def _poll_for_message(self, timeout=None):
-        """Is a separate method to isolate communication interface with Kafka"""
+        """
+        Is a separate method to isolate communication interface with Kafka.
+        Fetches a batch of messages from the broker into the message buffer; consume() hands them out one at a time.
+        Falls back to single message polls when batch fetching is disabled (see subscribe).
+        """
         if not timeout:
             timeout = self._poll_timeout
-        message = self._consumer.poll(timeout)
-        if message is None:
+        if self._batch_fetch:
+            # grab whatever is already fetched without blocking, since consume() otherwise waits for a full batch
+            messages = self._consumer.consume(num_messages=self._consume_batch_size, timeout=0)
+            if not messages:
+                messages = self._consumer.consume(num_messages=1, timeout=timeout)
+        else:
+            message = self._consumer.poll(timeout)
+            messages = [message] if message is not None else []
+        if not messages:
             raise NoMessageError
-        return message
+        self._message_buffer.extend(messages)
+
+    def _drop_buffered_messages(self, partitions, rewind=False):
+        """
+        Removes any buffered messages that belong to the given partitions.
+        If rewind, seeks each partition back to its earliest dropped message so it gets consumed again later.
+        """
+        if not self._message_buffer:
+            return
+        drop = {(p.topic, p.partition) for p in partitions}
+        earliest_offsets = {}
+        kept = deque()
+        for message in self._message_buffer:
+            topic_partition = (message.topic(), message.partition())
+            if topic_partition in drop:
+                earliest_offsets.setdefault(topic_partition, message.offset())
+            else:
+                kept.append(message)
+        self._message_buffer = kept
+        if rewind:
+            for (topic, partition), offset in earliest_offsets.items():
+                self._consumer.seek(TopicPartition(topic, partition, offset))
+
+    def _is_changelog_topic(self, topic):
+        is_changelog = self._is_changelog_cache.get(topic)
+        if is_changelog is None:
+            is_changelog = self._is_changelog_cache[topic] = '__changelog' in topic
+        return is_changelog
 
     def _handle_consumed_message(self):
         """
-        Handles a consumed message to check for errors and log the consumption as a metric.
-        If the message is returned with a breaking error, raises a ConsumeMessageError.
+        Handles a consumed message to log the consumption and record it as a metric.
+        NOTE: messages returned with an error have already raised a ConsumeError in _deserialize_message.
         """
-        try:
-            guid = get_guid_from_message(self.message)
-            if self.metrics_manager:
-                self.metrics_manager.set_seconds_behind(
-                    round(datetime.datetime.timestamp(datetime.datetime.utcnow())) - self.message.timestamp()[1] // 1000)
-            if '__changelog' not in self.message.topic():
+        message = self.message
+        topic = message.topic()
+        if self.metrics_manager:
+            timestamp_ms = message.timestamp()[1]
+            self.metrics_manager.set_seconds_behind(int(time.time()) - timestamp_ms // 1000)
+        if not self._is_changelog_topic(topic):
+            # guarded since the f-strings (and the key repr) would otherwise be built for every message
+            if LOGGER.isEnabledFor(logging.INFO):
+                guid = get_guid_from_message(message)  # only needed for this log line
                 LOGGER.info(
-                    f"Message consumed from topic {self.message.topic()} partition {self.message.partition()}, offset {self.message.offset()}; GUID {guid}")
-                LOGGER.debug(f"Consumed message key: {repr(self.message.key())}")
-        except AttributeError:
-            if "object has no attribute 'headers'" in str(self.message.error()):
-                raise ConsumeMessageError("Headers were inaccessible on the message. Potentially a corrupt message?")
+                    f"Message consumed from topic {topic} partition {message.partition()}, offset {message.offset()}; GUID {guid}")
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug(f"Consumed message key: {repr(message.key())}")
 
         # Increment the metric for consumed messages by one
         if self.metrics_manager:
-            self.metrics_manager.inc_messages_consumed(1, self.message.topic())
+            self.metrics_manager.inc_messages_consumed(1, topic)
 
+    # NOTE: key/value return the message's own objects (not copies), so mutations persist for that message
     def key(self):
-        return deepcopy(self.message.key())
+        return self.message.key()
 
     def value(self):
-        return deepcopy(self.message.value())
+        return self.message.value()
 
     def headers(self):
-        return deepcopy(parse_headers(self.message.headers()))
+        return parse_headers(self.message.headers())
 
     def messages(self):
         return [self.message]
@@ -120,7 +218,9 @@ class Consumer:
         Consumes a message from the broker while handling errors.
         If the message is valid, then the message is returned.
         """
-        self.message = self._poll_for_message(timeout)
+        if not self._message_buffer:
+            self._poll_for_message(timeout)
+        self.message = self._deserialize_message(self._message_buffer.popleft())
         self._handle_consumed_message()
         return self.message
 
@@ -128,6 +228,47 @@ class Consumer:
         self._consumer.store_offsets(self.message)
         self.message = None
 
+    # The methods below change what the consumer should fetch next, so buffered messages must be handled accordingly
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        """
+        Always registers revoke/lost callbacks so buffered messages from partitions this consumer no longer owns are
+        dropped, then chains to any provided callbacks.
+        NOTE: like confluent-kafka, on_revoke is used for lost partitions when no on_lost is provided.
+        NOTE: provided callbacks may raise (ex: FluviiTableApp raises PartitionsAssigned), and an exception raised
+        inside a batch consume() discards whatever that call already fetched; batch fetching is disabled in that case.
+        """
+        def _on_revoke(consumer, partitions):
+            self._drop_buffered_messages(partitions)
+            if on_revoke:
+                on_revoke(consumer, partitions)
+
+        def _on_lost(consumer, partitions):
+            self._drop_buffered_messages(partitions)
+            if on_lost or on_revoke:
+                (on_lost or on_revoke)(consumer, partitions)
+
+        self._batch_fetch = not (on_assign or on_revoke or on_lost)
+        callbacks = dict(on_revoke=_on_revoke, on_lost=_on_lost)
+        if on_assign:
+            callbacks['on_assign'] = on_assign
+        self._consumer.subscribe(topics, **callbacks)
+
+    def seek(self, partition):
+        self._drop_buffered_messages([partition])
+        self._consumer.seek(partition)
+
+    def pause(self, partitions):
+        self._drop_buffered_messages(partitions, rewind=True)
+        self._consumer.pause(partitions)
+
+    def incremental_unassign(self, partitions):
+        self._drop_buffered_messages(partitions)
+        self._consumer.incremental_unassign(partitions)
+
+    def unassign(self):
+        self._message_buffer.clear()
+        self._consumer.unassign()
+
 
 class TransactionalConsumer(Consumer):
     def __init__(self, urls, group_id, consume_topics_list, schema_registry=None, auto_subscribe=True,
@@ -146,57 +287,74 @@ class TransactionalConsumer(Consumer):
         self._batch_time_elapse_start = None
         self._consume_max_time_secs = batch_consume_max_time_seconds
         self._consume_max_count = batch_consume_max_count
+        if batch_consume_max_count:
+            self._consume_batch_size = batch_consume_max_count
         self._store_batch_messages = batch_consume_store_messages
+        self._messages = []  # reused across batches
+        self._topic_partition_pool = {}
         self._init_attrs()
 
     def _init_attrs(self):
-        self._batch_offset_starts = {}
-        self._batch_offset_ends = {}
-        self._messages = []
+        self._offset_events = []
+        self._messages.clear()
         self._consume_message_count = 0
     
     def _set_batch_start_time(self):
-        self._batch_time_elapse_start = datetime.datetime.now().timestamp()
+        self._batch_time_elapse_start = time.monotonic()
 
     def _max_consume_time_continue(self):
         continue_consume = True
         if self._consume_max_time_secs:
             if not self._batch_time_elapse_start:
                 self._set_batch_start_time()
-            seconds_elapsed = datetime.datetime.now().timestamp() - self._batch_time_elapse_start
+            seconds_elapsed = time.monotonic() - self._batch_time_elapse_start
             continue_consume = seconds_elapsed < self._consume_max_time_secs
             if not continue_consume:
                 self._batch_time_elapse_start = None
         return continue_consume
 
-    def _max_consume_count_continue(self, consume_multiplier=1):
-        if self._consume_max_count:
-            return self._consume_message_count < (self._consume_max_count * consume_multiplier)
-        return True
-
     def _keep_consuming(self, consume_multiplier=1):
-        return self._max_consume_count_continue(consume_multiplier=consume_multiplier) and self._max_consume_time_continue()
-
-    def _mark_offset_start(self):
-        if self.message.topic() not in self._batch_offset_starts:
-            self._batch_offset_starts[self.message.topic()] = {}
-        if self.message.partition() not in self._batch_offset_starts[self.message.topic()]:
-            self._batch_offset_starts[self.message.topic()][self.message.partition()] = self.message.offset()
-
-    def _mark_offset_end(self):
-        if self.message.topic() not in self._batch_offset_ends:
-            self._batch_offset_ends[self.message.topic()] = {}
-        self._batch_offset_ends[self.message.topic()][self.message.partition()] = self.message.offset()
+        """Checks the cheap count limit (inlined since this runs per message) before touching the clock"""
+        if self._consume_max_count and self._consume_message_count >= self._consume_max_count * consume_multiplier:
+            return False
+        if not self._consume_max_time_secs:
+            return True
+        return self._max_consume_time_continue()
+
+    def _mark_offset(self):
+        message = self.message
+        self._offset_events.append((message.topic(), message.partition(), message.offset()))
+
+    def _batch_offset_starts(self):
+        """Folds the marked offsets into the first offset consumed per (topic, partition) this batch"""
+        starts = {}
+        for topic, partition, offset in self._offset_events:
+            starts.setdefault((topic, partition), offset)
+        return starts
+
+    def _batch_offset_ends(self):
+        """Folds the marked offsets into the last offset consumed per (topic, partition) this batch"""
+        return {(topic, partition): offset for topic, partition, offset in self._offset_events}
+
+    def _pooled_topic_partition(self, topic, partition, offset):
+        """Reuses one TopicPartition per (topic, partition), only updating its offset"""
+        topic_partition = self._topic_partition_pool.get((topic, partition))
+        if topic_partition is None:
+            topic_partition = self._topic_partition_pool[(topic, partition)] = TopicPartition(topic, partition)
+        topic_partition.offset = offset
+        return topic_partition
 
     def _get_consumer_partition_assignment(self):
-        assignments = self._consumer.assignment()
-        assignments = {topic: [int(obj.partition) for obj in assignments if obj.topic == topic] for topic in set([obj.topic for obj in assignments])}
-        return assignments
+        assignments = defaultdict(set)
+        for obj in self._consumer.assignment():
+            assignments[obj.topic].add(int(obj.partition))
+        return {topic: frozenset(partitions) for topic, partitions in assignments.items()}
 
     def _commit(self, producer, offsets):
         if offsets:
-            if not producer.active_transaction:
+            if not producer.active_transaction:  # reuse the transaction the producer may have opened for outbound writes
                 producer.begin_transaction()
+            # NOTE: group metadata is intentionally fetched per commit; its generation/member id change on every rebalance
             producer.send_offsets_to_transaction(offsets, self._consumer.consumer_group_metadata())
         if producer.active_transaction:
             producer.commit_transaction(30)
@@ -212,8 +370,7 @@ class TransactionalConsumer(Consumer):
 
     def _handle_consumed_message(self):
         super()._handle_consumed_message()
-        self._mark_offset_start()
-        self._mark_offset_end()
+        self._mark_offset()
         self._consume_message_count += 1
         if self._store_batch_messages:
             self._messages.append(self.message)
@@ -230,17 +387,16 @@ class TransactionalConsumer(Consumer):
     def rollback_consumption(self):
         LOGGER.info('Rolling back consumer state to earliest non-committed offset(s)...')
         assignments = self._get_consumer_partition_assignment()
-        for topic, partitions in self._batch_offset_starts.items():
-            for partition, offset in partitions.items():
-                if partition in assignments.get(topic, []):
-                    LOGGER.info(f"Reversing topic {topic} partition {partition} back to offset {offset}")
-                    self.consumer.seek(TopicPartition(topic=topic, partition=partition, offset=offset))
-                    LOGGER.info(f"Consumer set topic {topic} partition {partition} to offset {self.consumer.position([TopicPartition(topic=topic, partition=partition)])[0].offset}")
+        for (topic, partition), offset in self._batch_offset_starts().items():
+            if partition in assignments.get(topic, frozenset()):
+                LOGGER.info(f"Reversing topic {topic} partition {partition} back to offset {offset}")
+                topic_partition = self._pooled_topic_partition(topic, partition, offset)
+                self.seek(topic_partition)
+                LOGGER.info(f"Consumer set topic {topic} partition {partition} to offset {self._consumer.position([topic_partition])[0].offset}")
         self._init_attrs()
 
     def commit(self, producer):
-        offsets_to_commit = [TopicPartition(topic, partition, offset + 1) for topic, partitions in
-                             self._batch_offset_ends.items() for partition, offset in partitions.items()]
+        offsets_to_commit = [self._pooled_topic_partition(topic, partition, offset + 1) for (topic, partition), offset in self._batch_offset_ends().items()]
         self._commit(producer, offsets_to_commit)
         self.message = None
         self._init_attrs()
@@ -255,7 +411,7 @@ class TransactionalConsumer(Consumer):
                 return super().consume(timeout=timeout)
             raise FinishedTransactionBatch
         except NoMessageError:
-            if self._batch_offset_ends:
+            if self._offset_events:
                 raise FinishedTransactionBatch
             else:
                 raise
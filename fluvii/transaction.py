@@ -57,13 +57,13 @@ class Transaction:
         self.message = self.consumer.consume(**kwargs)
 
     def key(self):
-        return deepcopy(self.message.key())
+        return self.message.key()
 
     def value(self):
-        return deepcopy(self.message.value())
+        return self.message.value()
 
     def headers(self):
-        return deepcopy(parse_headers(self.message.headers()))
+        return parse_headers(self.message.headers())
 
     def topic(self):
         return self.message.topic()